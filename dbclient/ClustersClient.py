@@ -6,33 +6,46 @@ import logging_utils
 import wmconstants
 from dbclient import *
 
+# automated clusters that should not be migrated:
+#   model endpoint clusters start with the `mlflow-model-` prefix
+#   dlt cluster names start with the `dlt-execution-` prefix
+#   legacy single task job clusters are named job-JOBID-run-RUNID
+#   multi-task job clusters are named job-JOBID-run-RUNID-{TASK_CLUSTER_NAME}
+_AUTOMATED_CLUSTER_RE = re.compile(r"(?:mlflow-model-|dlt-execution-|job-\d+-run-\d+(?:-.+)?$)")
+
+# cluster spec fields that are kept when exporting and editing clusters
+# https://docs.databricks.com/api/latest/clusters.html#request-structure
+_CREATE_CONFIGS = frozenset({'num_workers',
+                             'autoscale',
+                             'cluster_name',
+                             'spark_version',
+                             'spark_conf',
+                             'aws_attributes',
+                             'node_type_id',
+                             'driver_node_type_id',
+                             'ssh_public_keys',
+                             'custom_tags',
+                             'cluster_log_conf',
+                             'init_scripts',
+                             'docker_image',
+                             'spark_env_vars',
+                             'autotermination_minutes',
+                             'enable_elastic_disk',
+                             'instance_pool_id',
+                             'policy_id',
+                             'pinned_by_user_name',
+                             'creator_user_name',
+                             'cluster_id'})
+
 
 class ClustersClient(dbclient):
     def __init__(self, configs, checkpoint_service):
         super().__init__(configs)
         self._checkpoint_service = checkpoint_service
-
-    create_configs = {'num_workers',
-                      'autoscale',
-                      'cluster_name',
-                      'spark_version',
-                      'spark_conf',
-                      'aws_attributes',
-                      'node_type_id',
-                      'driver_node_type_id',
-                      'ssh_public_keys',
-                      'custom_tags',
-                      'cluster_log_conf',
-                      'init_scripts',
-                      'docker_image',
-                      'spark_env_vars',
-                      'autotermination_minutes',
-                      'enable_elastic_disk',
-                      'instance_pool_id',
-                      'policy_id',
-                      'pinned_by_user_name',
-                      'creator_user_name',
-                      'cluster_id'}
+        # old pool id to new pool id mapping, computed once since every pool based cluster needs it
+        self._instance_pool_id_mapping = None
+        # registered instance profiles, listed once and reused for the rest of the migration run
+        self._instance_profiles = None
 
     def cleanup_cluster_pool_configs(self, cluster_json, cluster_creator, is_job_cluster=False):
         """
@@ -43,7 +56,7 @@ class ClustersClient(dbclient):
                 as interactive clusters
         :return:
         """
-        pool_id_dict = self.get_instance_pool_id_mapping()
+        pool_id_dict = self.get_cached_instance_pool_id_mapping()
         # if pool id exists, remove instance types
         cluster_json.pop('node_type_id', None)
         cluster_json.pop('driver_node_type_id', None)
@@ -82,9 +95,7 @@ class ClustersClient(dbclient):
         if self.is_aws():
             logging.info("Updating cluster with: " + iam_role)
             current_cluster_json = self.get(f'/clusters/get?cluster_id={cid}')
-            run_properties = set(list(current_cluster_json.keys())) - self.create_configs
-            for p in run_properties:
-                del current_cluster_json[p]
+            current_cluster_json = {k: v for k, v in current_cluster_json.items() if k in _CREATE_CONFIGS}
             if 'aws_attributes' in current_cluster_json:
                 aws_conf = current_cluster_json.pop('aws_attributes')
                 aws_conf['instance_profile_arn'] = iam_role
@@ -108,16 +119,10 @@ class ClustersClient(dbclient):
         return perms
 
     def get_cluster_id_by_name(self, cname, running_only=False):
-        cluster_list = self.get('/clusters/list').get('clusters', [])
-        if running_only:
-            running = list(filter(lambda x: x['state'] == "RUNNING", cluster_list))
-            for x in running:
-                if cname == x['cluster_name']:
-                    return x['cluster_id']
-        else:
-            for x in cluster_list:
-                if cname == x['cluster_name']:
-                    return x['cluster_id']
+        cluster_list = self.get('/clusters/list').get('clusters') or []
+        for x in cluster_list:
+            if cname == x['cluster_name'] and (not running_only or x.get('state') == "RUNNING"):
+                return x['cluster_id']
         return None
 
     def get_cluster_list(self, alive=True):
@@ -125,19 +130,29 @@ class ClustersClient(dbclient):
         Returns an array of json objects for the running clusters.
         Grab the cluster_name or cluster_id
         """
-        clusters_list = self.get("/clusters/list", print_json=False).get('clusters', [])
-        if alive and clusters_list:
-            running = filter(lambda x: x['state'] == "RUNNING", clusters_list)
-            return list(running)
-        else:
-            return clusters_list
+        clusters_list = self.get("/clusters/list", print_json=False).get('clusters') or []
+        if alive:
+            return [x for x in clusters_list if x.get('state') == "RUNNING"]
+        return clusters_list
 
     def get_execution_context(self, cid):
         logging.info("Creating remote Spark Session")
-        time.sleep(5)
         ec_payload = {"language": "python",
                       "clusterId": cid}
-        ec = self.post('/contexts/create', json_params=ec_payload, version="1.2")
+        # the driver can still be coming online once the cluster is RUNNING, so retry with a short backoff
+        # instead of waiting a fixed amount of time before creating the context
+        retry_delays = [0.2, 0.4, 0.8, 1.6, 3.2]
+        while True:
+            try:
+                ec = self.post('/contexts/create', json_params=ec_payload, version="1.2")
+            except Exception as e:
+                if not retry_delays:
+                    raise
+                logging.info(f'Remote session is not ready yet: {e}')
+                ec = {}
+            if ec.get('id', None) or not retry_delays:
+                break
+            time.sleep(retry_delays.pop(0))
         # Grab the execution context ID
         ec_id = ec.get('id', None)
         if not ec_id:
@@ -175,6 +190,14 @@ class ClustersClient(dbclient):
                 pool_mapping_dict[old_pool_id] = new_pool_id
         return pool_mapping_dict
 
+    def get_cached_instance_pool_id_mapping(self):
+        """
+        Returns the instance pool id mapping, only listing the pools and reading the pool log on the first call
+        """
+        if self._instance_pool_id_mapping is None:
+            self._instance_pool_id_mapping = self.get_instance_pool_id_mapping()
+        return self._instance_pool_id_mapping
+
     def get_policy_id_by_name_dict(self):
         name_id_dict = {}
         resp = self.get('/policies/clusters/list').get('policies', [])
@@ -185,9 +208,18 @@ class ClustersClient(dbclient):
     def get_spark_versions(self):
         return self.get("/clusters/spark-versions", print_json=True)
 
+    def _list_instance_profiles(self, force=False):
+        """
+        Returns the list of registered instance profile json objects. The list is cached after the first call
+        :param force: list the instance profiles again even if they're cached
+        """
+        if force or self._instance_profiles is None:
+            self._instance_profiles = self.get('/instance-profiles/list').get('instance_profiles', [])
+        return self._instance_profiles
+
     def get_instance_profiles_list(self):
         if self.is_aws():
-            ip_json_list = self.get('/instance-profiles/list').get('instance_profiles', [])
+            ip_json_list = self._list_instance_profiles()
             iam_roles_list = list(map(lambda x: x.get('instance_profile_arn'), ip_json_list))
             return iam_roles_list
         return []
@@ -325,22 +357,30 @@ class ClustersClient(dbclient):
         with open(self.get_export_dir() + user_name_to_user_id_log_file, 'r') as fp:
             user_name_to_user_id = json.loads(fp.read())
 
-        old_to_new_cluster_mapping = self.get_cluster_id_mapping(cluster_log_file)
-
-        with open(self.get_export_dir() + cluster_log_file, 'r') as fp:
+        cluster_logfile = self.get_export_dir() + cluster_log_file
+        if not os.path.exists(cluster_logfile):
+            raise ValueError('Clusters log must exist to map clusters to previous existing cluster ids')
+        # single pass over the cluster log, only keeping the fields needed instead of the full cluster configs
+        old_clusters = {}
+        original_cluster_creators = []
+        with open(cluster_logfile, 'r') as fp:
             for line in fp:
                 cluster_conf = json.loads(line)
-                if 'creator_user_name' in cluster_conf and 'cluster_id' in cluster_conf:
-                    original_cluster_creator = cluster_conf['creator_user_name']
-                    original_cluster_id = cluster_conf['cluster_id']
-                    if original_cluster_id in old_to_new_cluster_mapping and original_cluster_creator in user_name_to_user_id:
-                        current_cluster_id = old_to_new_cluster_mapping[original_cluster_id]
-                        cluster_ids_to_change_creator.append(current_cluster_id)
-                        original_creator_user_ids.append(user_name_to_user_id[original_cluster_creator])
-                    else:
-                        print("The old cluster id " + original_cluster_id + " with the original_creator of " +
-                              original_cluster_creator +
-                              " does not get logged for EditClusterOwner due to some problems.")
+                old_clusters[cluster_conf['cluster_name']] = cluster_conf['cluster_id']
+                if 'creator_user_name' in cluster_conf:
+                    original_cluster_creators.append((cluster_conf['cluster_id'], cluster_conf['creator_user_name']))
+
+        old_to_new_cluster_mapping = self._map_old_to_new_cluster_ids(old_clusters)
+
+        for original_cluster_id, original_cluster_creator in original_cluster_creators:
+            if original_cluster_id in old_to_new_cluster_mapping and original_cluster_creator in user_name_to_user_id:
+                current_cluster_id = old_to_new_cluster_mapping[original_cluster_id]
+                cluster_ids_to_change_creator.append(current_cluster_id)
+                original_creator_user_ids.append(user_name_to_user_id[original_cluster_creator])
+            else:
+                print("The old cluster id " + original_cluster_id + " with the original_creator of " +
+                      original_cluster_creator +
+                      " does not get logged for EditClusterOwner due to some problems.")
 
         with open(self.get_export_dir() + cluster_ids_file, 'w') as fp:
             dumped_cluster_ids = json.dumps(cluster_ids_to_change_creator, separators=(',', ':'))
@@ -359,7 +399,6 @@ class ClustersClient(dbclient):
         :return: old_cluster_id -> new_cluster_id dictionary.
         """
         cluster_logfile = self.get_export_dir() + log_file
-        current_cl = self.get_cluster_list(False)
         old_clusters = {}
         # build dict with old cluster name to cluster id mapping
         if not os.path.exists(cluster_logfile):
@@ -368,6 +407,15 @@ class ClustersClient(dbclient):
             for line in fp:
                 conf = json.loads(line)
                 old_clusters[conf['cluster_name']] = conf['cluster_id']
+        return self._map_old_to_new_cluster_ids(old_clusters)
+
+    def _map_old_to_new_cluster_ids(self, old_clusters):
+        """
+        Map old cluster ids to the ids of the clusters with the same name in the current workspace
+        :param old_clusters: old cluster_name -> old cluster_id dictionary
+        :return: old_cluster_id -> new_cluster_id dictionary
+        """
+        current_cl = self.get_cluster_list(False)
         old_to_new_mapping = {}
         for new_cluster in current_cl:
             old_cluster_id = old_clusters.get(new_cluster['cluster_name'], None)
@@ -429,6 +477,8 @@ class ClustersClient(dbclient):
                 pool_resp = self.post('/instance-pools/create', pool_conf)
                 ignore_error_list = ['INVALID_PARAMETER_VALUE']
                 logging_utils.log_reponse_error(error_logger, pool_resp, ignore_error_list=ignore_error_list)
+        # new pools have been created, so the cached pool id mapping is stale
+        self._instance_pool_id_mapping = None
 
     def import_instance_profiles(self, log_file='instance_profiles.log'):
         # currently an AWS only operation
@@ -439,7 +489,7 @@ class ClustersClient(dbclient):
             logging.info("No instance profiles to import.")
             return
         # check current profiles and skip if the profile already exists
-        ip_list = self.get('/instance-profiles/list').get('instance_profiles', None)
+        ip_list = self._list_instance_profiles()
         if ip_list:
             list_of_profiles = [x['instance_profile_arn'] for x in ip_list]
         else:
@@ -455,6 +505,9 @@ class ClustersClient(dbclient):
                         import_profiles_count += 1
                 else:
                     logging.info("Skipping since profile already exists: {0}".format(ip_arn))
+        if import_profiles_count:
+            # new profiles were added, so the cached list is stale
+            self._instance_profiles = None
         return import_profiles_count
 
     def is_spark_3(self, cid):
@@ -516,7 +569,7 @@ class ClustersClient(dbclient):
         # pinned by cluster_user is a flag per cluster
         cl_raw = self.get_cluster_list(False)
         cluster_list = self.remove_automated_clusters(cl_raw)
-        ip_list = self.get('/instance-profiles/list').get('instance_profiles', [])
+        ip_list = self._list_instance_profiles()
         nonempty_ip_list = []
         if ip_list:
             # filter none if we hit a profile w/ a none object
@@ -525,11 +578,14 @@ class ClustersClient(dbclient):
 
         # filter on these items as MVP of the cluster configs
         # https://docs.databricks.com/api/latest/clusters.html#request-structure
+        # serialized records are buffered and written in batches
+        batch_size = 256
+        cluster_lines = []
+        acl_lines = []
         with open(cluster_log, 'w') as log_fp, open(acl_cluster_log, 'w') as acl_log_fp:
             for cluster_json in cluster_list:
-                run_properties = set(list(cluster_json.keys())) - self.create_configs
-                for p in run_properties:
-                    del cluster_json[p]
+                # keep only the fields needed to create the cluster
+                cluster_json = {k: v for k, v in cluster_json.items() if k in _CREATE_CONFIGS}
                 if 'aws_attributes' in cluster_json:
                     aws_conf = cluster_json.pop('aws_attributes')
                     iam_role = aws_conf.get('instance_profile_arn', None)
@@ -541,15 +597,22 @@ class ClustersClient(dbclient):
                     cluster_json['aws_attributes'] = aws_conf
                 cluster_perms = self.get_cluster_acls(cluster_json['cluster_id'], cluster_json['cluster_name'])
                 if cluster_perms['http_status_code'] == 200:
-                    acl_log_fp.write(json.dumps(cluster_perms) + '\n')
+                    acl_lines.append(json.dumps(cluster_perms) + '\n')
                 else:
                     error_logger.error(f'Failed to get cluster ACL: {cluster_perms}')
 
                 if filter_user:
                     if cluster_json['creator_user_name'] == filter_user:
-                        log_fp.write(json.dumps(cluster_json) + '\n')
+                        cluster_lines.append(json.dumps(cluster_json) + '\n')
                 else:
-                    log_fp.write(json.dumps(cluster_json) + '\n')
+                    cluster_lines.append(json.dumps(cluster_json) + '\n')
+                if len(cluster_lines) >= batch_size or len(acl_lines) >= batch_size:
+                    log_fp.writelines(cluster_lines)
+                    acl_log_fp.writelines(acl_lines)
+                    cluster_lines.clear()
+                    acl_lines.clear()
+            log_fp.writelines(cluster_lines)
+            acl_log_fp.writelines(acl_lines)
 
     def log_cluster_policies(self, log_file='cluster_policies.log', acl_log_file='acl_cluster_policies.log'):
         policies_log = self.get_export_dir() + log_file
@@ -579,7 +642,7 @@ class ClustersClient(dbclient):
 
     def log_instance_profiles(self, log_file='instance_profiles.log'):
         ip_log = self.get_export_dir() + log_file
-        ips = self.get('/instance-profiles/list').get('instance_profiles', None)
+        ips = self._list_instance_profiles()
         if ips:
             with open(ip_log, "w") as fp:
                 for x in ips:
@@ -587,20 +650,7 @@ class ClustersClient(dbclient):
 
     @staticmethod
     def is_excluded_cluster(cluster_name):
-        # model endpoint clusters start with `mlflow-model-` prefix
-        ml_model_pattern = "mlflow-model-"
-        # dlt cluster names start with the `dlt-execution-` prefix
-        dlt_execution_pattern = "dlt-execution-"
-        # job clusters have specific format for legacy single task jobs, job-JOBID-run-RUNID
-        re_expr_old = re.compile("job-\d+-run-\d+$")
-        # job clusters have specific format for mutli-task jobs, job-JOBID-run-RUNID-{TASK_CLUSTER_NAME}
-        re_expr_mtj = re.compile("job-\d+-run-\d+-.+$")
-        if (re_expr_old.match(cluster_name) 
-            or re_expr_mtj.match(cluster_name) 
-            or cluster_name.startswith(ml_model_pattern)
-            or cluster_name.startswith(dlt_execution_pattern)):
-            return True
-        return False
+        return _AUTOMATED_CLUSTER_RE.match(cluster_name) is not None
 
     def remove_automated_clusters(self, cluster_list, log_file='skipped_clusters.log'):
         """
@@ -609,11 +659,13 @@ class ClustersClient(dbclient):
         :return: cleaned list with automated clusters removed
         """
         clean_cluster_list = []
+        # local name to skip the module attribute lookup for each skipped cluster
+        dumps = json.dumps
         with open(self.get_export_dir() + log_file, 'w') as log_fp:
             for cluster in cluster_list:
                 cluster_name = cluster['cluster_name']
                 if self.is_excluded_cluster(cluster_name):
-                    log_fp.write(json.dumps(cluster) + '\n')
+                    log_fp.write(dumps(cluster) + '\n')
                 else:
                     clean_cluster_list.append(cluster)
         return clean_cluster_list
@@ -652,11 +704,14 @@ class ClustersClient(dbclient):
         resp = self.get('/commands/status', json_params=result_payload, version="1.2")
         is_running = self.get_key(resp, 'status')
 
-        # loop through the status api to check for the 'running' state call and sleep 1 second
+        # loop through the status api to check for the 'running' state call. back off exponentially from 50ms
+        # up to 1 second so that short commands are not rounded up to a full second
+        delay = 0.05
         while (is_running == "Running") or (is_running == 'Queued'):
+            time.sleep(delay)
+            delay = min(delay * 1.5, 1.0)
             resp = self.get('/commands/status', json_params=result_payload, version="1.2")
             is_running = self.get_key(resp, 'status')
-            time.sleep(1)
         end_result_status = self.get_key(resp, 'status')
         end_results = self.get_key(resp, 'results')
         if end_results.get('resultType', None) == 'error':
@@ -665,10 +720,13 @@ class ClustersClient(dbclient):
 
     def wait_for_cluster(self, cid):
         c_state = self.get('/clusters/get', {'cluster_id': cid})
+        # back off exponentially from 250ms up to 4 seconds between cluster state checks
+        delay = 0.25
         while c_state['state'] != 'RUNNING' and c_state['state'] != 'TERMINATED':
+            time.sleep(delay)
+            delay = min(delay * 2, 4)
             c_state = self.get('/clusters/get', {'cluster_id': cid})
             print('Cluster state: {0}'.format(c_state['state']))
-            time.sleep(2)
         if c_state['state'] == 'TERMINATED':
             raise RuntimeError("Cluster is terminated. Please check EVENT history for details")
         return cid
@@ -1,7 +1,6 @@
 import ast
 import json
 import os
-import time
 from datetime import timedelta
 from timeit import default_timer as timer
 
@@ -27,7 +26,6 @@ class DbfsClient(ClustersClient):
         cid = self.launch_cluster()
         end = timer()
         print("Cluster creation time: " + str(timedelta(seconds=end - start)))
-        time.sleep(5)
         ec_id = self.get_execution_context(cid)
 
         # get all dbfs mount metadata
@@ -1,8 +1,11 @@
-import ast
 import os
 import base64
 import wmconstants
-import time
+import queue
+import concurrent
+from concurrent.futures import ThreadPoolExecutor
+from thread_safe_writer import ThreadSafeWriter
+from threading_utils import propagate_exceptions
 from datetime import timedelta
 from timeit import default_timer as timer
 import logging
@@ -10,6 +13,13 @@ import logging_utils
 import re
 from dbclient import *
 
+# suffix of the per database catalog file that holds one json record for each exported table ddl
+TABLE_CATALOG_SUFFIX = '.tables.jsonl'
+
+# spark.sql() command wrapped around the base64 encoded DDL to run it remotely
+_SPARK_DDL_PRE = 'import base64; spark.sql(base64.b64decode("'
+_SPARK_DDL_SUF = '").decode("utf-8"))'
+
 
 class HiveClient(ClustersClient):
 
@@ -18,34 +28,32 @@ class HiveClient(ClustersClient):
         self._checkpoint_service = checkpoint_service
 
     @staticmethod
-    def is_delta_table(local_path):
-        with open(local_path, 'r') as fp:
-            for line in fp:
-                lower_line = line.lower()
-                if lower_line.startswith('using delta'):
-                    return True
+    def is_delta_table(table_ddl):
+        for line in table_ddl.splitlines():
+            lower_line = line.lower()
+            if lower_line.startswith('using delta'):
+                return True
         return False
 
     @staticmethod
-    def get_ddl_by_keyword_group(local_path):
+    def get_ddl_by_keyword_group(table_ddl):
         """
         return a list of DDL strings that are grouped by keyword arguments and their parameters
         """
         ddl_statement = []
         parameter_group = []
-        with open(local_path, 'r') as fp:
-            for line in fp:
-                raw = line.rstrip()
-                if not raw:
-                    # make sure it's not an empty line, continue if empty
-                    continue
-                if raw[0] == ' ' or raw[0] == ')':
-                    parameter_group.append(raw)
-                else:
-                    if parameter_group:
-                        ddl_statement.append(''.join(parameter_group))
-                    parameter_group = [raw]
-            ddl_statement.append(''.join(parameter_group))
+        for line in table_ddl.splitlines():
+            raw = line.rstrip()
+            if not raw:
+                # make sure it's not an empty line, continue if empty
+                continue
+            if raw[0] == ' ' or raw[0] == ')':
+                parameter_group.append(raw)
+            else:
+                if parameter_group:
+                    ddl_statement.append(''.join(parameter_group))
+                parameter_group = [raw]
+        ddl_statement.append(''.join(parameter_group))
         return ddl_statement
 
     @staticmethod
@@ -58,10 +66,10 @@ class HiveClient(ClustersClient):
                 return f'OPTIONS ( {x} )'
         return ''
 
-    def is_table_location_defined(self, local_table_path):
+    def is_table_location_defined(self, table_ddl):
         """ check if LOCATION or OPTIONS(path ..) are defined for the table
         """
-        ddl_statement = self.get_ddl_by_keyword_group(local_table_path)
+        ddl_statement = self.get_ddl_by_keyword_group(table_ddl)
         for keyword_param in ddl_statement:
             if keyword_param.startswith('OPTIONS'):
                 options_param = self.get_path_option_if_available(keyword_param)
@@ -73,86 +81,138 @@ class HiveClient(ClustersClient):
                 return True
         return False
 
-    def get_local_tmp_ddl_if_applicable(self, current_local_ddl_path):
+    def remove_ddl_options_if_applicable(self, table_ddl):
         """
         method to identify if we should update the current DDL if OPTIONS or TBLPROPERTIES keywords exist
+        :return: the updated DDL, or the original DDL if no update is needed
         """
-        ddl_statement = self.get_ddl_by_keyword_group(current_local_ddl_path)
-        tmp_ddl_path = self.get_export_dir() + 'tmp_ddl.txt'
-        return_tmp_file = False
-        with open(tmp_ddl_path, 'w') as fp:
-            for keyword_param in ddl_statement:
-                if keyword_param.startswith('OPTIONS'):
-                    return_tmp_file = True
-                    options_param = self.get_path_option_if_available(keyword_param)
-                    if options_param:
-                        fp.write(options_param + ' ')
-                    continue
-                elif keyword_param.startswith('TBLPROPERTIES'):
-                    return_tmp_file = True
-                    continue
-                fp.write(keyword_param + ' ')
-        if return_tmp_file:
-            return tmp_ddl_path
-        else:
-            os.remove(tmp_ddl_path)
-            return current_local_ddl_path
-
-    def update_table_ddl(self, local_table_path, db_path):
+        ddl_statement = self.get_ddl_by_keyword_group(table_ddl)
+        updated_ddl = []
+        is_updated = False
+        for keyword_param in ddl_statement:
+            if keyword_param.startswith('OPTIONS'):
+                is_updated = True
+                options_param = self.get_path_option_if_available(keyword_param)
+                if options_param:
+                    updated_ddl.append(options_param + ' ')
+                continue
+            elif keyword_param.startswith('TBLPROPERTIES'):
+                is_updated = True
+                continue
+            updated_ddl.append(keyword_param + ' ')
+        if is_updated:
+            return ''.join(updated_ddl)
+        return table_ddl
+
+    def update_table_ddl(self, table_name, table_ddl, db_path):
         # check if the database location / path is the default DBFS path
-        table_name = os.path.basename(local_table_path)
         is_db_default_path = db_path.startswith('dbfs:/user/hive/warehouse')
-        if (not is_db_default_path) and (not self.is_table_location_defined(local_table_path)):
+        if (not is_db_default_path) and (not self.is_table_location_defined(table_ddl)):
             # the LOCATION attribute is not defined and the Database has a custom location defined
             # therefore we need to add it to the DDL, e.g. dbfs:/db_path/table_name
             table_path = db_path + '/' + table_name
-            location_stmt = f"\nLOCATION '{table_path}'"
-            with open(local_table_path, 'a') as fp:
-                fp.write(location_stmt)
-            return True
-        return False
+            return table_ddl + f"\nLOCATION '{table_path}'"
+        return table_ddl
+
+    def prepare_table_ddl(self, table_name, table_ddl, db_path):
+        """
+        Update the DDL before applying it on the destination workspace
+        :param table_name: table name without the database prefix
+        :param table_ddl: exported DDL text of the table
+        :param db_path: database S3 / Blob Storage / ADLS path for the Database
+        :return: DDL text to apply
+        """
+        table_ddl = self.update_table_ddl(table_name, table_ddl, db_path)
+        # remove OPTIONS and TBLPROPERTIES from the DDL for delta tables
+        if self.is_delta_table(table_ddl):
+            table_ddl = self.remove_ddl_options_if_applicable(table_ddl)
+        return table_ddl
+
+    @staticmethod
+    def is_large_ddl(table_ddl, has_unicode=False):
+        """
+        Large DDLs or DDLs with unicode characters are uploaded to DBFS before they are applied
+        """
+        # get DDL size in bytes
+        ddl_size_bytes = len(table_ddl.encode('utf-8'))
+        return ddl_size_bytes > 1024 or has_unicode
 
-    def apply_table_ddl(self, local_table_path, ec_id, cid, db_path, has_unicode=False):
+    def apply_large_table_ddl(self, table_ddl, ec_id, cid):
+        """
+        Upload the DDL to a tmp DBFS path and apply it from there
+        :return: rest api response
+        """
+        dbfs_path = '/tmp/migration/tmp_import_ddl.txt'
+        path_args = {'path': dbfs_path}
+        del_resp = self.post('/dbfs/delete', path_args)
+        if self.is_verbose():
+            logging.info(del_resp)
+        file_content_json = {'files': table_ddl.encode('utf-8')}
+        put_resp = self.post('/dbfs/put', path_args, files_json=file_content_json)
+        if self.is_verbose():
+            logging.info(put_resp)
+        spark_big_ddl_cmd = f'with open("/dbfs{dbfs_path}", "r") as fp: tmp_ddl = fp.read(); spark.sql(tmp_ddl)'
+        ddl_results = self.submit_command(cid, ec_id, spark_big_ddl_cmd)
+        return ddl_results
+
+    def apply_table_ddl(self, table_name, table_ddl, ec_id, cid, db_path, has_unicode=False):
         """
         Run DDL command on destination workspace
-        :param local_table_path: local file path to the table DDL
+        :param table_name: table name without the database prefix
+        :param table_ddl: exported DDL text of the table
         :param ec_id: execution context id to run remote commands
         :param cid: cluster id to connect to
         :param db_path: database S3 / Blob Storage / ADLS path for the Database
         :param has_unicode: Whether the table definitions have unicode characters.
         :return: rest api response
         """
-        # get file size in bytes
-        updated_table_status = self.update_table_ddl(local_table_path, db_path)
-        # update local table ddl to a new temp file with OPTIONS and TBLPROPERTIES removed from the DDL for delta tables
-        if self.is_delta_table(local_table_path):
-            local_table_path = self.get_local_tmp_ddl_if_applicable(local_table_path)
-
-        f_size_bytes = os.path.getsize(local_table_path)
-        if f_size_bytes > 1024 or has_unicode:
-            # upload first to tmp DBFS path and apply
-            dbfs_path = '/tmp/migration/tmp_import_ddl.txt'
-            path_args = {'path': dbfs_path}
-            del_resp = self.post('/dbfs/delete', path_args)
-            if self.is_verbose():
-                logging.info(del_resp)
-            file_content_json = {'files': open(local_table_path, 'r')}
-            put_resp = self.post('/dbfs/put', path_args, files_json=file_content_json)
-            if self.is_verbose():
-                logging.info(put_resp)
-            spark_big_ddl_cmd = f'with open("/dbfs{dbfs_path}", "r") as fp: tmp_ddl = fp.read(); spark.sql(tmp_ddl)'
-            ddl_results = self.submit_command(cid, ec_id, spark_big_ddl_cmd)
-            return ddl_results
+        table_ddl = self.prepare_table_ddl(table_name, table_ddl, db_path)
+        if self.is_large_ddl(table_ddl, has_unicode):
+            return self.apply_large_table_ddl(table_ddl, ec_id, cid)
         else:
-            with open(local_table_path, "r") as fp:
-                ddl_statement = fp.read()
-                spark_ddl_statement = self.get_spark_ddl(ddl_statement)
-                ddl_results = self.submit_command(cid, ec_id, spark_ddl_statement)
-                return ddl_results
+            spark_ddl_statement = self.get_spark_ddl(table_ddl)
+            ddl_results = self.submit_command(cid, ec_id, spark_ddl_statement)
+            return ddl_results
+
+    def apply_table_ddl_batch(self, table_ddls, ec_id, cid):
+        """
+        Run a batch of DDL statements on destination workspace with one remote command
+        :param table_ddls: list of DDL strings to apply
+        :param ec_id: execution context id to run remote commands
+        :param cid: cluster id to connect to
+        :return: list of results in the same order as table_ddls, with an error result for each failed statement
+        """
+        if not table_ddls:
+            return []
+        # the ddls are sent base64 encoded so that quotes or unicode characters in the DDL text can't break the command
+        b64_ddls = [base64.b64encode(x.encode('utf-8')).decode('ascii') for x in table_ddls]
+        batch_ddl_cmd = f"""import base64, json
+ddl_errors = []
+for i, b64_ddl in enumerate({json.dumps(b64_ddls)}):
+    try:
+        spark.sql(base64.b64decode(b64_ddl).decode('utf-8'))
+    except Exception as e:
+        ddl_errors.append([i, f"{{type(e).__name__}}: {{e}}"])
+print(json.dumps(ddl_errors))"""
+        batch_resp = self.submit_command(cid, ec_id, batch_ddl_cmd)
+        ddl_errors = None
+        if batch_resp.get('resultType', None) == 'text':
+            try:
+                ddl_errors = json.loads(batch_resp['data'])
+            except ValueError:
+                # the output is truncated or has unexpected text in it
+                logging.error("Unable to parse the batch DDL import output")
+        if ddl_errors is None:
+            logging.error("Batch DDL import failed, applying DDLs one at a time")
+            return [self.submit_command(cid, ec_id, self.get_spark_ddl(x)) for x in table_ddls]
+        ddl_results = [{'resultType': 'text'} for _ in table_ddls]
+        for i, error_summary in ddl_errors:
+            ddl_results[i] = {'resultType': 'error', 'summary': error_summary}
+        return ddl_results
 
     def check_if_instance_profiles_exists(self, log_file='instance_profiles.log'):
         ip_log = self.get_export_dir() + log_file
-        ips = self.get('/instance-profiles/list').get('instance_profiles', None)
+        ips = self._list_instance_profiles()
         if ips:
             with open(ip_log, "w") as fp:
                 for x in ips:
@@ -206,12 +266,12 @@ class HiveClient(ClustersClient):
         :param ec_id: execution id aka spark context id
         :return: database json object
         """
-        desc_database_cmd = f'print(get_db_details(\"{db_name}\"))'
+        desc_database_cmd = f'import json; print(json.dumps(get_db_details(\"{db_name}\")))'
         results = self.submit_command(cid, ec_id, desc_database_cmd)
         if results['resultType'] != 'text':
             print(json.dumps(results) + '\n')
             raise ValueError("Desc database extended failure")
-        db_json = ast.literal_eval(results['data'])
+        db_json = json.loads(results['data'])
         return db_json
 
     def export_database(self, db_name, cluster_name=None, iam_role=None, metastore_dir='metastore/',
@@ -236,7 +296,6 @@ class HiveClient(ClustersClient):
             cid = self.launch_cluster(current_iam)
         end = timer()
         logging.info("Cluster creation time: " + str(timedelta(seconds=end - start)))
-        time.sleep(5)
         ec_id = self.get_execution_context(cid)
         checkpoint_metastore_set = self._checkpoint_service.get_checkpoint_key_set(
             wmconstants.WM_EXPORT, wmconstants.METASTORE_TABLES)
@@ -253,12 +312,16 @@ class HiveClient(ClustersClient):
         with open(database_logfile, 'w') as fp:
             db_json = self.get_desc_database_details(db_name, cid, ec_id)
             fp.write(json.dumps(db_json) + '\n')
-        os.makedirs(self.get_export_dir() + metastore_dir + db_name, exist_ok=True)
-        self.log_all_tables(db_name, cid, ec_id, metastore_dir, error_logger,
-                            success_metastore_log_path, current_iam, checkpoint_metastore_set, has_unicode)
+        os.makedirs(self.get_export_dir() + metastore_dir, exist_ok=True)
+        success_log_writer = ThreadSafeWriter(success_metastore_log_path, 'a')
+        try:
+            self.log_all_tables(db_name, cid, ec_id, metastore_dir, error_logger,
+                                success_log_writer, current_iam, checkpoint_metastore_set, has_unicode)
+        finally:
+            success_log_writer.close()
 
     def export_hive_metastore(self, cluster_name=None, metastore_dir='metastore/', db_log='database_details.log',
-                              success_log='success_metastore.log', has_unicode=False):
+                              success_log='success_metastore.log', has_unicode=False, num_parallel=4):
         start = timer()
         checkpoint_metastore_set = self._checkpoint_service.get_checkpoint_key_set(
             wmconstants.WM_EXPORT, wmconstants.METASTORE_TABLES)
@@ -277,7 +340,6 @@ class HiveClient(ClustersClient):
             cid = self.launch_cluster()
         end = timer()
         logging.info("Cluster creation time: " + str(timedelta(seconds=end - start)))
-        time.sleep(5)
         ec_id = self.get_execution_context(cid)
         # if metastore failed log path exists, cleanup before re-running
         success_metastore_log_path = self.get_export_dir() + success_log
@@ -285,17 +347,29 @@ class HiveClient(ClustersClient):
         if os.path.exists(success_metastore_log_path):
             os.remove(success_metastore_log_path)
         all_dbs = self.get_all_databases(error_logger, cid, ec_id)
-        resp = self.set_desc_database_helper(cid, ec_id)
-        if self.is_verbose():
-            logging.info(resp)
-        with open(database_logfile, 'w') as fp:
-            for db_name in all_dbs:
-                logging.info(f"Fetching details from database: {db_name}")
-                os.makedirs(self.get_export_dir() + metastore_dir + db_name, exist_ok=True)
-                db_json = self.get_desc_database_details(db_name, cid, ec_id)
-                fp.write(json.dumps(db_json) + '\n')
-                self.log_all_tables(db_name, cid, ec_id, metastore_dir, error_logger,
-                                    success_metastore_log_path, current_iam_role, checkpoint_metastore_set, has_unicode)
+        # databases are exported in parallel, each thread runs its remote commands in its own execution context
+        ec_id_pool = queue.Queue()
+        for i in range(0, max(1, min(num_parallel, len(all_dbs)))):
+            worker_ec_id = ec_id if i == 0 else self.get_execution_context(cid)
+            resp = self.set_desc_database_helper(cid, worker_ec_id)
+            if self.is_verbose():
+                logging.info(resp)
+            ec_id_pool.put(worker_ec_id)
+        database_log_writer = ThreadSafeWriter(database_logfile, 'w')
+        # the success log is shared by the export threads, so every batch is written under the writer lock
+        success_log_writer = ThreadSafeWriter(success_metastore_log_path, 'a')
+        try:
+            with ThreadPoolExecutor(max_workers=ec_id_pool.qsize()) as executor:
+                futures = [executor.submit(self._export_database_with_context_pool, db_name, cid, ec_id_pool,
+                                           metastore_dir, database_log_writer, error_logger, success_log_writer,
+                                           current_iam_role, checkpoint_metastore_set, has_unicode)
+                           for db_name in all_dbs]
+                concurrent.futures.wait(futures, return_when="FIRST_EXCEPTION")
+                propagate_exceptions(futures)
+        finally:
+            database_log_writer.close()
+            success_log_writer.close()
+        failed_dbs = [db_name for db_name, future in zip(all_dbs, futures) if not future.result()]
 
         failed_log_file = logging_utils.get_error_log_file(
             wmconstants.WM_EXPORT, wmconstants.METASTORE_TABLES, self.get_export_dir())
@@ -306,29 +380,54 @@ class HiveClient(ClustersClient):
             self.retry_failed_metastore_export(cid, failed_log_file, error_logger, remaining_iam_roles,
                                                success_metastore_log_path, has_unicode, checkpoint_metastore_set)
             logging.info("Failed count before retry: " + str(total_failed_entries))
-            logging.info("Total Databases attempted export: " + str(len(all_dbs)))
         else:
             logging.error("Failed count: " + str(total_failed_entries))
-            logging.info("Total Databases attempted export: " + str(len(all_dbs)))
+        if failed_dbs:
+            logging.error(f"Failed to list tables of {len(failed_dbs)} database(s): {', '.join(failed_dbs)}")
+        logging.info("Total Databases attempted export: " + str(len(all_dbs)))
+
+    def _export_database_with_context_pool(self, db_name, cid, ec_id_pool, metastore_dir, database_log_writer,
+                                           error_logger, success_log_writer, iam, checkpoint_metastore_set, has_unicode):
+        """
+        Export the database details and all table DDLs of a database using an execution context from the pool.
+        The execution context is returned to the pool once the database is exported
+        :return: True if the tables of the database were listed, False otherwise
+        """
+        ec_id = ec_id_pool.get()
+        try:
+            logging.info(f"Fetching details from database: {db_name}")
+            os.makedirs(self.get_export_dir() + metastore_dir, exist_ok=True)
+            db_json = self.get_desc_database_details(db_name, cid, ec_id)
+            database_log_writer.write(json.dumps(db_json) + '\n')
+            return self.log_all_tables(db_name, cid, ec_id, metastore_dir, error_logger,
+                                       success_log_writer, iam, checkpoint_metastore_set, has_unicode)
+        finally:
+            ec_id_pool.put(ec_id)
 
     @staticmethod
     def get_num_of_lines(filename):
-        if not os.path.exists(filename):
+        if not os.path.exists(filename) or os.path.getsize(filename) == 0:
             return 0
-        else:
-            i = 0
-            with open(filename) as fp:
-                for line in fp:
-                    i += 1
-            return i
+        # count newlines over 1MB reads instead of iterating the file line by line
+        num_of_lines = 0
+        last_chunk = b''
+        with open(filename, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                num_of_lines += chunk.count(b'\n')
+                last_chunk = chunk
+        # the last line is counted even if it doesn't end with a newline
+        if not last_chunk.endswith(b'\n'):
+            num_of_lines += 1
+        return num_of_lines
 
     @staticmethod
     def get_spark_ddl(table_ddl):
         """
-        Formats the provided DDL into spark.sql() command to run remotely
+        Formats the provided DDL into spark.sql() command to run remotely. The DDL is sent base64 encoded so that
+        quotes in the DDL text, e.g. triple quoted comments, can't break the command
         """
-        spark_ddl = 'spark.sql(""" {0} """)'.format(table_ddl)
-        return spark_ddl
+        b64_ddl = base64.b64encode(table_ddl.encode('utf-8')).decode('ascii')
+        return f'{_SPARK_DDL_PRE}{b64_ddl}{_SPARK_DDL_SUF}'
 
     @staticmethod
     def is_ddl_a_view(ddl_list):
@@ -337,15 +436,64 @@ class HiveClient(ClustersClient):
             return True
         return False
 
-    def move_table_view(self, db_name, tbl_name, local_table_ddl, views_dir='metastore_views/'):
+    def move_table_view(self, db_name, tbl_name, table_ddl, views_dir='metastore_views/'):
         metastore_view_dir = self.get_export_dir() + views_dir
-        ddl_statement = self.get_ddl_by_keyword_group(local_table_ddl)
+        ddl_statement = self.get_ddl_by_keyword_group(table_ddl)
         if self.is_ddl_a_view(ddl_statement):
             dst_local_ddl = metastore_view_dir + db_name + '/' + tbl_name
-            os.rename(local_table_ddl, dst_local_ddl)
+            with open(dst_local_ddl, 'w') as fp:
+                fp.write(table_ddl)
             return True
         return False
 
+    def get_table_catalog_path(self, metastore_dir, db_name):
+        return self.get_export_dir() + metastore_dir + db_name + TABLE_CATALOG_SUFFIX
+
+    def append_table_catalog(self, metastore_dir, db_name, table_ddls):
+        """
+        Append exported DDLs to the table catalog of the database
+        :param table_ddls: list of (table name, ddl) pairs
+        """
+        if not table_ddls:
+            return
+        with open(self.get_table_catalog_path(metastore_dir, db_name), 'a') as fp:
+            fp.writelines(json.dumps({'table': table_name, 'ddl': ddl}) + '\n' for table_name, ddl in table_ddls)
+
+    def get_exported_databases(self, metastore_local_dir):
+        """
+        List the exported databases, either from their table catalog or from the per table DDL directory
+        used by older exports
+        """
+        db_names = set()
+        for entry in self.scandir(metastore_local_dir):
+            if entry.is_dir():
+                db_names.add(entry.name)
+            elif entry.name.endswith(TABLE_CATALOG_SUFFIX):
+                db_names.add(entry.name[:-len(TABLE_CATALOG_SUFFIX)])
+            else:
+                logging.error("Error: Only databases should exist at this level: {0}".format(entry.name))
+        return sorted(db_names)
+
+    def get_exported_table_ddls(self, metastore_local_dir, db_name):
+        """
+        Read the exported DDLs of a database from its table catalog. Per table DDL files written by older exports
+        are read as well, the catalog takes precedence and the last catalog record of a table wins on re-runs
+        :return: dict of table name to DDL
+        """
+        table_ddls = {}
+        legacy_db_dir = metastore_local_dir + db_name
+        if os.path.isdir(legacy_db_dir):
+            for tbl_entry in self.scandir(legacy_db_dir):
+                with open(tbl_entry.path, 'rb') as fp:
+                    table_ddls[tbl_entry.name] = fp.read().decode()
+        catalog_path = legacy_db_dir + TABLE_CATALOG_SUFFIX
+        if os.path.exists(catalog_path):
+            with open(catalog_path, 'r') as fp:
+                for line in fp:
+                    table_json = json.loads(line)
+                    table_ddls[table_json['table']] = table_json['ddl']
+        return table_ddls
+
     def import_hive_metastore(self, cluster_name=None, metastore_dir='metastore/', views_dir='metastore_views/',
                               has_unicode=False, should_repair_table=False):
         metastore_local_dir = self.get_export_dir() + metastore_dir
@@ -356,17 +504,13 @@ class HiveClient(ClustersClient):
             wmconstants.WM_IMPORT, wmconstants.METASTORE_TABLES)
         os.makedirs(metastore_view_dir, exist_ok=True)
         (cid, ec_id) = self.get_or_launch_cluster(cluster_name)
-        # get local databases
-        db_list = self.listdir(metastore_local_dir)
         # make directory in DBFS root bucket path for tmp data
         self.post('/dbfs/mkdirs', {'path': '/tmp/migration/'})
         # iterate over the databases saved locally
         all_db_details_json = self.get_database_detail_dict()
-        for db_name in db_list:
+        for db_name in self.get_exported_databases(metastore_local_dir):
             # create a dir to host the view ddl if we find them
             os.makedirs(metastore_view_dir + db_name, exist_ok=True)
-            # get the local database path to list tables
-            local_db_path = metastore_local_dir + db_name
             # get a dict of the database attributes
             database_attributes = all_db_details_json.get(db_name, {})
             if not database_attributes:
@@ -377,25 +521,34 @@ class HiveClient(ClustersClient):
                 logging.error(f"Failed to create database {db_name} during metastore import. Exiting Import.")
                 return
             db_path = database_attributes.get('Location')
-            if os.path.isdir(local_db_path):
-                # all databases should be directories, no files at this level
-                # list all the tables in the database local dir
-                tables = self.listdir(local_db_path)
-                for tbl_name in tables:
-                    # build the path for the table where the ddl is stored
-                    full_table_name = f"{db_name}.{tbl_name}"
-                    if not checkpoint_metastore_set.contains(full_table_name):
-                        logging.info(f"Importing table {full_table_name}")
-                        local_table_ddl = metastore_local_dir + db_name + '/' + tbl_name
-                        if not self.move_table_view(db_name, tbl_name, local_table_ddl):
-                            # we hit a table ddl here, so we apply the ddl
-                            resp = self.apply_table_ddl(local_table_ddl, ec_id, cid, db_path, has_unicode)
+            # small DDLs are applied in batches to share a single remote command
+            batch_size = 50
+            pending_tables = []
+            pending_ddls = []
+            for tbl_name, table_ddl in self.get_exported_table_ddls(metastore_local_dir, db_name).items():
+                full_table_name = f"{db_name}.{tbl_name}"
+                if not checkpoint_metastore_set.contains(full_table_name):
+                    logging.info(f"Importing table {full_table_name}")
+                    if not self.move_table_view(db_name, tbl_name, table_ddl):
+                        # we hit a table ddl here, so we apply the ddl
+                        table_ddl = self.prepare_table_ddl(tbl_name, table_ddl, db_path)
+                        # only the size decides if the DDL skips the batch, the batch is base64 encoded and
+                        # safe for unicode DDLs
+                        if self.is_large_ddl(table_ddl):
+                            resp = self.apply_large_table_ddl(table_ddl, ec_id, cid)
                             if not logging_utils.log_reponse_error(error_logger, resp):
                                 checkpoint_metastore_set.write(full_table_name)
                         else:
-                            logging.info(f'Moving view ddl to re-apply later: {db_name}.{tbl_name}')
-            else:
-                logging.error("Error: Only databases should exist at this level: {0}".format(db_name))
+                            pending_ddls.append(table_ddl)
+                            pending_tables.append(full_table_name)
+                    else:
+                        logging.info(f'Moving view ddl to re-apply later: {db_name}.{tbl_name}')
+                if len(pending_ddls) >= batch_size:
+                    self._apply_pending_table_ddls(pending_tables, pending_ddls, ec_id, cid, error_logger,
+                                                   checkpoint_metastore_set)
+                    pending_tables, pending_ddls = [], []
+            self._apply_pending_table_ddls(pending_tables, pending_ddls, ec_id, cid, error_logger,
+                                           checkpoint_metastore_set)
             self.delete_dir_if_empty(metastore_view_dir + db_name)
         views_db_list = self.listdir(metastore_view_dir)
         for db_name in views_db_list:
@@ -409,7 +562,9 @@ class HiveClient(ClustersClient):
                     if not checkpoint_metastore_set.contains(full_view_name):
                         logging.info(f"Importing view {full_view_name}")
                         local_view_ddl = metastore_view_dir + db_name + '/' + view_name
-                        resp = self.apply_table_ddl(local_view_ddl, ec_id, cid, db_path, has_unicode)
+                        with open(local_view_ddl, 'rb') as fp:
+                            view_ddl = fp.read().decode()
+                        resp = self.apply_table_ddl(view_name, view_ddl, ec_id, cid, db_path, has_unicode)
                         if logging_utils.log_reponse_error(error_logger, resp):
                             checkpoint_metastore_set.write(full_view_name)
                         logging.info(resp)
@@ -419,73 +574,179 @@ class HiveClient(ClustersClient):
             self.report_legacy_tables_to_fix()
             self.repair_legacy_tables(cluster_name)
 
+    def _apply_pending_table_ddls(self, table_names, table_ddls, ec_id, cid, error_logger, checkpoint_metastore_set):
+        ddl_results = self.apply_table_ddl_batch(table_ddls, ec_id, cid)
+        for full_table_name, resp in zip(table_names, ddl_results):
+            resp['table'] = full_table_name
+            if not logging_utils.log_reponse_error(error_logger, resp):
+                checkpoint_metastore_set.write(full_table_name)
+
+    def get_remote_list(self, cid, ec_id, list_var, list_cmd, batch_size=100, error_logger=None, error_details=None):
+        """
+        Assign the list returned by list_cmd to list_var on the cluster and fetch its values.
+        The first command returns the size of the list along with the first batch, the remaining batches are only
+        fetched if the list is larger than batch_size
+        :param list_var: variable name used to keep the list in the execution context
+        :param list_cmd: python expression to evaluate on the cluster that returns a list
+        :param error_logger: logger for the failed response, the root logger is used if not provided
+        :param error_details: dict of fields added to the logged failed response
+        :return: list of values, None if the list or one of its batches could not be fetched
+        """
+        logger = error_logger or logging
+        error_details = error_details or {}
+        first_batch_cmd = f'{list_var} = {list_cmd}; import json; ' \
+                          f'print(json.dumps([len({list_var}), {list_var}[:{batch_size}]]))'
+        results = self.submit_command(cid, ec_id, first_batch_cmd)
+        if results.get('resultType', None) != 'text':
+            logger.error(json.dumps({**results, **error_details}))
+            return None
+        list_len, values = json.loads(results['data'])
+        for m in range(batch_size, list_len, batch_size):
+            batch_cmd = f'print(json.dumps({list_var}[{m}:{m + batch_size}]))'
+            results = self.submit_command(cid, ec_id, batch_cmd)
+            if results.get('resultType', None) != 'text':
+                logger.error(json.dumps({**results, **error_details}))
+                return None
+            values.extend(json.loads(results['data']))
+        return values
+
     def get_all_databases(self, error_logger, cid, ec_id):
-        # submit first command to find number of databases
         # DBR 7.0 changes databaseName to namespace for the return value of show databases
-        all_dbs_cmd = 'all_dbs = [x.databaseName for x in spark.sql("show databases").collect()]; print(len(all_dbs))'
-        results = self.submit_command(cid, ec_id, all_dbs_cmd)
-        if logging_utils.log_reponse_error(error_logger, results):
+        all_dbs_cmd = '[x.databaseName for x in spark.sql("show databases").collect()]'
+        all_dbs = self.get_remote_list(cid, ec_id, 'all_dbs', all_dbs_cmd, error_logger=error_logger)
+        if all_dbs is None:
             raise ValueError("Cannot identify number of databases due to the above error")
-        num_of_dbs = ast.literal_eval(results['data'])
-        batch_size = 100    # batch size to iterate over databases
-        num_of_buckets = (num_of_dbs // batch_size) + 1     # number of slices of the list to take
-
-        all_dbs = []
-        for m in range(0, num_of_buckets):
-            db_slice = 'print(all_dbs[{0}:{1}])'.format(batch_size*m, batch_size*(m+1))
-            results = self.submit_command(cid, ec_id, db_slice)
-            db_names = ast.literal_eval(results['data'])
-            for db in db_names:
-                all_dbs.append(db)
-                logging.info("Database: {0}".format(db))
+        for db in all_dbs:
+            logging.info("Database: {0}".format(db))
         return all_dbs
 
-    def log_all_tables(self, db_name, cid, ec_id, metastore_dir, error_logger, success_log_path, iam,
+    def log_all_tables(self, db_name, cid, ec_id, metastore_dir, error_logger, success_log_writer, iam,
                        checkpoint_metastore_set, has_unicode=False):
+        """
+        Export the DDLs of all tables in the database
+        :param success_log_writer: ThreadSafeWriter of the success log, shared by the databases exported in parallel
+        :return: True if the tables of the database were listed, False otherwise
+        """
         logging.info(f"Fetching tables from database: {db_name}")
-        all_tables_cmd = 'all_tables = [x.tableName for x in spark.sql("show tables in {0}").collect()]'.format(db_name)
-        results = self.submit_command(cid, ec_id, all_tables_cmd)
-        results = self.submit_command(cid, ec_id, 'print(len(all_tables))')
-        num_of_tables = ast.literal_eval(results['data'])
-
-        batch_size = 100    # batch size to iterate over databases
-        num_of_buckets = (num_of_tables // batch_size) + 1     # number of slices of the list to take
-
-        with open(success_log_path, 'a') as sfp:
-            for m in range(0, num_of_buckets):
-                tables_slice = 'print(all_tables[{0}:{1}])'.format(batch_size*m, batch_size*(m+1))
-                results = self.submit_command(cid, ec_id, tables_slice)
-                table_names = ast.literal_eval(results['data'])
-                for table_name in table_names:
-                    full_table_name = f'{db_name}.{table_name}'
-                    if checkpoint_metastore_set.contains(full_table_name):
-                        is_successful = True
-                    else:
-                        is_successful = self.log_table_ddl(cid, ec_id, db_name, table_name, metastore_dir,
-                                                           error_logger, has_unicode)
-                        logging.info(f"Exported {full_table_name}")
-
-                    if is_successful:
-                        success_item = {'table': full_table_name, 'iam': iam}
-                        sfp.write(json.dumps(success_item))
-                        sfp.write('\n')
-                        self._persist_to_disk(sfp)
-                        checkpoint_metastore_set.write(full_table_name)
-                    else:
-                        logging.info("Logging failure")
+        all_tables_cmd = '[x.tableName for x in spark.sql("show tables in {0}").collect()]'.format(db_name)
+        # the failed response is logged with a `database` key to tell it apart from the failed table entries
+        all_tables = self.get_remote_list(cid, ec_id, 'all_tables', all_tables_cmd, error_logger=error_logger,
+                                          error_details={'database': db_name})
+        if all_tables is None:
+            logging.error(f"Failed to list tables in database: {db_name}")
+            return False
+        # start with an empty table catalog unless tables of this database were checkpointed by a previous run,
+        # otherwise re-runs append the whole database to the catalog again
+        if not any(checkpoint_metastore_set.contains(f'{db_name}.{x}') for x in all_tables):
+            catalog_path = self.get_table_catalog_path(metastore_dir, db_name)
+            if os.path.exists(catalog_path):
+                os.remove(catalog_path)
+
+        batch_size = 100    # batch size to iterate over tables
+        for m in range(0, len(all_tables), batch_size):
+            table_names = all_tables[m:m + batch_size]
+            tables_to_export = [x for x in table_names
+                                if not checkpoint_metastore_set.contains(f'{db_name}.{x}')]
+            exported_tables = self.log_table_ddl_batch(cid, ec_id, db_name, tables_to_export, metastore_dir,
+                                                       error_logger, has_unicode)
+            successful_tables = []
+            for table_name in table_names:
+                full_table_name = f'{db_name}.{table_name}'
+                if checkpoint_metastore_set.contains(full_table_name):
+                    is_successful = True
+                else:
+                    is_successful = exported_tables[table_name]
+                    logging.info(f"Exported {full_table_name}")
+
+                if is_successful:
+                    successful_tables.append(full_table_name)
+                else:
+                    logging.info("Logging failure")
+            # write the batch with a single locked write and persist the success log, then checkpoint the batch
+            success_log_writer.write(''.join(json.dumps({'table': x, 'iam': iam}) + '\n' for x in successful_tables))
+            self._persist_to_disk(success_log_writer)
+            for full_table_name in successful_tables:
+                checkpoint_metastore_set.write(full_table_name)
         return True
 
-    def log_table_ddl(self, cid, ec_id, db_name, table_name, metastore_dir, error_logger, has_unicode):
+    @staticmethod
+    def get_batch_ddl_cmd(db_name, table_names, max_ddl_len=2048, max_batch_len=32768):
+        """
+        Build the remote command to fetch the DDLs of a batch of tables in a single round trip.
+        The command prints a json list of [table_name, ddl] pairs where ddl is a dict with an `error` key
+        if `show create table` failed, or None if the DDL is empty or too large to return inline.
+        The inline DDLs of the batch are capped at max_batch_len json encoded characters to keep the command output
+        small, DDLs past the cap are returned as None as well
+        """
+        return f"""import json
+ddl_batch = []
+inline_len = 0
+for t in {json.dumps(table_names)}:
+    try:
+        ddl = spark.sql(f"show create table {db_name}.{{t}}").collect()[0][0]
+        ddl_json_len = len(json.dumps(ddl))
+        if 0 < len(ddl) <= {max_ddl_len} and inline_len + ddl_json_len <= {max_batch_len}:
+            inline_len += ddl_json_len
+            ddl_batch.append([t, ddl])
+        else:
+            ddl_batch.append([t, None])
+    except Exception as e:
+        ddl_batch.append([t, {{"error": str(e)}}])
+print(json.dumps(ddl_batch))"""
+
+    def log_table_ddl_batch(self, cid, ec_id, db_name, table_names, metastore_dir, error_logger, has_unicode):
         """
-        Log the table DDL to handle large DDL text
+        Log the DDLs for a batch of tables in the same database with one remote command.
+        DDLs that are too large to return inline are fetched one at a time with get_table_ddl.
+        The DDLs are appended to the table catalog of the database
         :param cid: cluster id
         :param ec_id: execution context id (rest api 1.2)
         :param db_name: database name
-        :param table_name: table name
+        :param table_names: list of table names to export
         :param metastore_dir: metastore export directory name
-        :param err_log_path: log for errors
+        :param error_logger: logger for errors
+        :param has_unicode: export large DDLs to a file if this flag is true
+        :return: dict of table name to True for success, False for error
+        """
+        if not table_names:
+            return {}
+        batch_resp = self.submit_command(cid, ec_id, self.get_batch_ddl_cmd(db_name, table_names))
+        ddl_batch = None
+        if batch_resp.get('resultType', None) == 'text':
+            try:
+                ddl_batch = json.loads(batch_resp['data'])
+            except ValueError:
+                # the output is truncated or has unexpected text in it
+                logging.error(f"Unable to parse the batch DDL export output for database {db_name}")
+        if ddl_batch is None:
+            logging.error(f"Batch DDL export failed for database {db_name}, exporting tables one at a time")
+            ddl_batch = [[x, None] for x in table_names]
+        exported_tables = {}
+        exported_ddls = []
+        for table_name, ddl in ddl_batch:
+            if ddl is None:
+                ddl = self.get_table_ddl(cid, ec_id, db_name, table_name, error_logger, has_unicode)
+            elif isinstance(ddl, dict):
+                error_logger.error(json.dumps({'resultType': 'error',
+                                               'summary': ddl['error'],
+                                               'table': f'{db_name}.{table_name}'}))
+                ddl = None
+            if ddl is not None:
+                exported_ddls.append((table_name, ddl))
+            exported_tables[table_name] = ddl is not None
+        self.append_table_catalog(metastore_dir, db_name, exported_ddls)
+        return exported_tables
+
+    def get_table_ddl(self, cid, ec_id, db_name, table_name, error_logger, has_unicode):
+        """
+        Get the table DDL to handle large DDL text
+        :param cid: cluster id
+        :param ec_id: execution context id (rest api 1.2)
+        :param db_name: database name
+        :param table_name: table name
+        :param error_logger: logger for errors
         :param has_unicode: export to a file if this flag is true
-        :return: True for success, False for error
+        :return: DDL text, None for error
         """
         set_ddl_str_cmd = f'ddl_str = spark.sql("show create table {db_name}.{table_name}").collect()[0][0]'
         ddl_str_resp = self.submit_command(cid, ec_id, set_ddl_str_cmd)
@@ -493,38 +754,35 @@ class HiveClient(ClustersClient):
         if ddl_str_resp['resultType'] != 'text':
             ddl_str_resp['table'] = '{0}.{1}'.format(db_name, table_name)
             error_logger.error(json.dumps(ddl_str_resp))
-            return False
+            return None
         get_ddl_str_len = 'ddl_len = len(ddl_str); print(ddl_len)'
         len_resp = self.submit_command(cid, ec_id, get_ddl_str_len)
         ddl_len = int(len_resp['data'])
         if ddl_len <= 0:
             len_resp['table'] = '{0}.{1}'.format(db_name, table_name)
             error_logger.error(json.dumps(len_resp) + '\n')
-            return False
+            return None
         # if (len > 2k chars) OR (has unicode chars) then export to file
-        table_ddl_path = self.get_export_dir() + metastore_dir + db_name + '/' + table_name
         if ddl_len > 2048 or has_unicode:
             # create the dbfs tmp path for exports / imports. no-op if exists
             resp = self.post('/dbfs/mkdirs', {'path': '/tmp/migration/'})
             if logging_utils.log_reponse_error(error_logger, resp):
-                return False
+                return None
             # save the ddl to the tmp path on dbfs
-            save_ddl_cmd = "with open('/dbfs/tmp/migration/tmp_export_ddl.txt', 'w') as fp: fp.write(ddl_str)"
+            # use a tmp file per execution context since databases can be exported in parallel
+            tmp_ddl_path = f'/tmp/migration/tmp_export_ddl_{ec_id}.txt'
+            save_ddl_cmd = f"with open('/dbfs{tmp_ddl_path}', 'w') as fp: fp.write(ddl_str)"
             save_resp = self.submit_command(cid, ec_id, save_ddl_cmd)
             if logging_utils.log_reponse_error(error_logger, save_resp):
-                return False
+                return None
             # read that data using the dbfs rest endpoint which can handle 2MB of text easily
-            read_args = {'path': '/tmp/migration/tmp_export_ddl.txt'}
+            read_args = {'path': tmp_ddl_path}
             read_resp = self.get('/dbfs/read', read_args)
-            with open(table_ddl_path, "w") as fp:
-                fp.write(base64.b64decode(read_resp.get('data')).decode('utf-8'))
-            return True
+            return base64.b64decode(read_resp.get('data')).decode('utf-8')
         else:
             export_ddl_cmd = 'print(ddl_str)'
             ddl_resp = self.submit_command(cid, ec_id, export_ddl_cmd)
-            with open(table_ddl_path, "w") as fp:
-                fp.write(ddl_resp.get('data'))
-            return True
+            return ddl_resp.get('data')
 
     def retry_failed_metastore_export(self, cid, failed_metastore_log_path, error_logger, iam_roles_list, success_metastore_log_path,
                                       has_unicode, checkpoint_metastore_set, metastore_dir='metastore/'):
@@ -537,38 +795,55 @@ class HiveClient(ClustersClient):
         total_failed_entries = self.get_num_of_lines(failed_metastore_log_path)
         if do_instance_profile_exist:
             logging.info("Instance profiles exist, retrying export of failed tables with each instance profile")
-            err_log_list = []
+            # failed log entries keyed by the full table name, successful exports are removed from the dict
+            failed_tables = {}
+            # entries of databases whose tables could not be listed are not retried, they are kept in the log
+            failed_db_entries = []
             with open(failed_metastore_log_path, 'r') as err_log:
-                for table in err_log:
-                    err_log_list.append(table)
+                for line in err_log:
+                    failed_entry = json.loads(line)
+                    if 'table' in failed_entry:
+                        failed_tables[failed_entry['table']] = line
+                    else:
+                        failed_db_entries.append(line)
 
             with open(success_metastore_log_path, 'a') as sfp:
                 for iam_role in iam_roles_list:
+                    if not failed_tables:
+                        logging.info("All failed tables have been exported, skipping the remaining iam roles")
+                        break
                     self.edit_cluster(cid, iam_role)
                     ec_id = self.get_execution_context(cid)
-                    for table in err_log_list:
-                        table_json = json.loads(table)
-                        db_name = table_json['table'].split(".")[0]
-                        table_name = table_json['table'].split(".")[1]
-
-                        is_successful = self.log_table_ddl(cid, ec_id, db_name, table_name, metastore_dir,
-                                                           error_logger, has_unicode)
-                        if is_successful:
-                            err_log_list.remove(table)
-                            logging.info(f"Exported {db_name}.{table_name}")
-                            success_item = {'table': f'{db_name}.{table_name}', 'iam': iam_role}
-                            sfp.write(json.dumps(success_item))
-                            sfp.write('\n')
-                            self._persist_to_disk(sfp)
-                            checkpoint_metastore_set.write(f'{db_name}.{table_name}')
-                        else:
-                            logging.error('Failed to get ddl for {0}.{1} with iam role {2}'.format(db_name, table_name,
-                                                                                           iam_role))
+                    # group the failed tables by database to export them in batches
+                    failed_tables_by_db = {}
+                    for full_table_name in failed_tables:
+                        db_name, table_name = full_table_name.split(".", 1)
+                        failed_tables_by_db.setdefault(db_name, []).append(table_name)
+
+                    batch_size = 100    # batch size to iterate over tables
+                    for db_name, table_names in failed_tables_by_db.items():
+                        for m in range(0, len(table_names), batch_size):
+                            exported_tables = self.log_table_ddl_batch(cid, ec_id, db_name,
+                                                                       table_names[m:m + batch_size],
+                                                                       metastore_dir, error_logger, has_unicode)
+                            for table_name, is_successful in exported_tables.items():
+                                full_table_name = f'{db_name}.{table_name}'
+                                if is_successful:
+                                    del failed_tables[full_table_name]
+                                    logging.info(f"Exported {full_table_name}")
+                                    success_item = {'table': full_table_name, 'iam': iam_role}
+                                    sfp.write(json.dumps(success_item))
+                                    sfp.write('\n')
+                                    self._persist_to_disk(sfp)
+                                    checkpoint_metastore_set.write(full_table_name)
+                                else:
+                                    logging.error('Failed to get ddl for {0} with iam role {1}'.format(
+                                        full_table_name, iam_role))
 
                     os.remove(failed_metastore_log_path)
                     with open(failed_metastore_log_path, 'w') as fm:
-                        for table in err_log_list:
-                            fm.write(table)
+                        fm.writelines(failed_db_entries)
+                        fm.writelines(failed_tables.values())
                     failed_count_after_retry = self.get_num_of_lines(failed_metastore_log_path)
                     logging.error("Failed count after retry: " + str(failed_count_after_retry))
         else:
@@ -577,21 +852,14 @@ class HiveClient(ClustersClient):
     def report_legacy_tables_to_fix(self, metastore_dir='metastore/', fix_table_log='repair_tables.log'):
         metastore_local_dir = self.get_export_dir() + metastore_dir
         fix_log = self.get_export_dir() + fix_table_log
-        db_list = self.listdir(metastore_local_dir)
         num_of_tables = 0
         with open(fix_log, 'w+') as fp:
-            for db_name in db_list:
-                local_db_path = metastore_local_dir + db_name
-                if os.path.isdir(local_db_path):
-                    # all databases should be directories, no files at this level
-                    # list all the tables in the database local dir
-                    tables = self.listdir(local_db_path)
-                    for tbl_name in tables:
-                        local_table_ddl = local_db_path + '/' + tbl_name
-                        if self.is_legacy_table_partitioned(local_table_ddl):
-                            num_of_tables += 1
-                            logging.info(f'Table needs repair: {db_name}.{tbl_name}')
-                            fp.write(f'{db_name}.{tbl_name}\n')
+            for db_name in self.get_exported_databases(metastore_local_dir):
+                for tbl_name, table_ddl in self.get_exported_table_ddls(metastore_local_dir, db_name).items():
+                    if self.is_legacy_table_partitioned(table_ddl):
+                        num_of_tables += 1
+                        logging.info(f'Table needs repair: {db_name}.{tbl_name}')
+                        fp.write(f'{db_name}.{tbl_name}\n')
         # once completed, check if the file exists
         log_size = os.stat(fix_log).st_size
         if log_size > 0:
@@ -628,9 +896,9 @@ class HiveClient(ClustersClient):
 
         logging.error(f"{failed_repairs} table(s) failed to repair. See errors in {failed_repair_table_log}")
 
-    def is_legacy_table_partitioned(self, table_local_path):
-        if not self.is_delta_table(table_local_path):
-            ddl_group = self.get_ddl_by_keyword_group(table_local_path)
+    def is_legacy_table_partitioned(self, table_ddl):
+        if not self.is_delta_table(table_ddl):
+            ddl_group = self.get_ddl_by_keyword_group(table_ddl)
             for kw in ddl_group:
                 kw_lower = kw.lower()
                 if kw_lower.startswith('partitioned by'):
@@ -638,13 +906,12 @@ class HiveClient(ClustersClient):
         return False
 
     # We need to wait for the cluster to be ready to get the execution context, otherwise the API will fail.
-    # Once the cluster is available via the clusters api, we still need to wait a few seconds for the driver to come online.
+    # Once the cluster is available via the clusters api, get_execution_context retries until the driver is online.
     def get_or_launch_cluster(self, cluster_name=None):
         if cluster_name:
             cid = self.start_cluster_by_name(cluster_name)
         else:
             cid = self.launch_cluster()
-        time.sleep(2)
         ec_id = self.get_execution_context(cid)
         return cid, ec_id
 
@@ -1,6 +1,5 @@
 from dbclient import *
 import os
-import time
 from timeit import default_timer as timer
 import base64
 import logging_utils
@@ -39,7 +38,6 @@ class SecretsClient(ClustersClient):
         os.makedirs(scopes_dir, exist_ok=True)
         start = timer()
         cid = self.start_cluster_by_name(cluster_name) if cluster_name else self.launch_cluster()
-        time.sleep(5)
         ec_id = self.get_execution_context(cid)
         for scope_json in scopes_list:
             scope_name = scope_json.get('name')
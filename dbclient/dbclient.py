@@ -109,6 +109,16 @@ class dbclient:
                 continue
             yield x
 
+    @staticmethod
+    def scandir(f_path):
+        # same as listdir, but yields os.DirEntry objects to check the entry type without an extra stat call
+        with os.scandir(f_path) as it:
+            for entry in it:
+                # remove hidden directories / files from function
+                if entry.name.startswith('.'):
+                    continue
+                yield entry
+
     @staticmethod
     def walk(f_path):
         for my_root, my_subdir, my_files in os.walk(f_path):
@@ -1,7 +1,7 @@
 import json
 import os
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from dbclient import ClustersClient
 from dbclient.test.TestUtils import TEST_CONFIG
 
@@ -162,6 +162,40 @@ class TestClustersClient(unittest.TestCase):
         self.assertEqual(expected_user_ids, output_user_ids)
         self.assertEqual(expected_cluster_ids, output_cluster_ids)
 
+    def test_is_excluded_cluster(self):
+        self.assertTrue(ClustersClient.is_excluded_cluster('mlflow-model-my_model'))
+        self.assertTrue(ClustersClient.is_excluded_cluster('dlt-execution-1234'))
+        self.assertTrue(ClustersClient.is_excluded_cluster('job-123-run-456'))
+        self.assertTrue(ClustersClient.is_excluded_cluster('job-123-run-456-task_cluster'))
+        self.assertFalse(ClustersClient.is_excluded_cluster('job-123-run-456-'))
+        self.assertFalse(ClustersClient.is_excluded_cluster('my-job-123-run-456'))
+        self.assertFalse(ClustersClient.is_excluded_cluster('interactive_cluster'))
+
+    def test_cleanup_cluster_pool_configs_caches_pool_id_mapping(self):
+        clustersClient = ClustersClient(TEST_CONFIG, MagicMock())
+        clustersClient.get_instance_pool_id_mapping = MagicMock(return_value={'old_pool_id': 'new_pool_id'})
+        for i in range(3):
+            cluster_json = clustersClient.cleanup_cluster_pool_configs(
+                {'cluster_name': f'cluster_{i}', 'instance_pool_id': 'old_pool_id', 'node_type_id': 'i3.xlarge'},
+                'cluster_creator')
+            self.assertEqual(cluster_json['instance_pool_id'], 'new_pool_id')
+            self.assertNotIn('node_type_id', cluster_json)
+        clustersClient.get_instance_pool_id_mapping.assert_called_once()
+
+    @patch('time.sleep')
+    def test_get_execution_context_retries_until_ready(self, mock_sleep):
+        clustersClient = ClustersClient(TEST_CONFIG, MagicMock())
+        clustersClient.post = MagicMock(side_effect=[Exception("Error: post request failed with code 500"),
+                                                     {'error': 'ContextNotReady'},
+                                                     {'id': 'ec_id_1'}])
+        self.assertEqual(clustersClient.get_execution_context('cid_1'), 'ec_id_1')
+        self.assertEqual([x[0][0] for x in mock_sleep.call_args_list], [0.2, 0.4])
+
+        clustersClient.post = MagicMock(return_value={'error': 'ContextNotReady'})
+        with self.assertRaises(Exception):
+            clustersClient.get_execution_context('cid_1')
+        self.assertEqual(clustersClient.post.call_count, 6)
+
 
 if __name__ == '__main__':
     unittest.main()
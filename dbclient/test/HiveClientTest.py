@@ -3,6 +3,12 @@ from unittest.mock import MagicMock
 import mock as mock
 from dbclient import HiveClient
 from dbclient.test.TestUtils import TEST_CONFIG
+from checkpoint_service import DisabledCheckpointKeySet
+from thread_safe_writer import ThreadSafeWriter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
 from io import StringIO
 
 class TestHiveClient(unittest.TestCase):
@@ -44,4 +50,326 @@ class TestHiveClient(unittest.TestCase):
             hiveClient.repair_legacy_tables(fix_table_log='test_repair_tables.log')
             output = fake_out.getvalue().split("\n")
             self.assertEqual(output[0], 'Table failed repair: default.test_legacy2')
-            self.assertEqual(output[1], '1 table(s) failed to repair. See errors in failed_repair_tables.log')
\ No newline at end of file
+            self.assertEqual(output[1], '1 table(s) failed to repair. See errors in failed_repair_tables.log')
+
+    def test_log_table_ddl_batch(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        batch_output = [["tbl1", "CREATE TABLE default.tbl1 (id INT)"],
+                        ["tbl2", {"error": "Table or view not found"}],
+                        ["tbl3", None]]
+        hiveClient.submit_command = MagicMock(return_value={'resultType': 'text', 'data': json.dumps(batch_output)})
+        hiveClient.get_table_ddl = MagicMock(return_value="CREATE TABLE default.tbl3 (name STRING)")
+        error_logger = MagicMock()
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            os.makedirs(os.path.join(export_dir, 'metastore'))
+            exported_tables = hiveClient.log_table_ddl_batch("123", "456", "default", ["tbl1", "tbl2", "tbl3"],
+                                                             'metastore/', error_logger, False)
+            with open(os.path.join(export_dir, 'metastore', 'default.tables.jsonl'), 'r') as fp:
+                catalog = [json.loads(line) for line in fp]
+        self.assertEqual(catalog, [{'table': 'tbl1', 'ddl': "CREATE TABLE default.tbl1 (id INT)"},
+                                   {'table': 'tbl3', 'ddl': "CREATE TABLE default.tbl3 (name STRING)"}])
+        self.assertEqual(exported_tables, {"tbl1": True, "tbl2": False, "tbl3": True})
+        self.assertEqual(hiveClient.submit_command.call_count, 1)
+        hiveClient.get_table_ddl.assert_called_once_with("123", "456", "default", "tbl3", error_logger, False)
+        self.assertEqual(json.loads(error_logger.error.call_args[0][0])['table'], "default.tbl2")
+
+    def test_log_table_ddl_batch_unparsable_output(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.get_table_ddl = MagicMock(side_effect=lambda cid, ec_id, db_name, table_name, error_logger,
+                                             has_unicode: f"CREATE TABLE {db_name}.{table_name} (id INT)")
+        truncated_output = json.dumps([["tbl1", "CREATE TABLE default.tbl1 (id INT)"],
+                                       ["tbl2", "CREATE TABLE default.tbl2 (id INT)"]])[:40]
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            os.makedirs(os.path.join(export_dir, 'metastore'))
+            for data in (truncated_output, 'Warning: spark session restarted\n[]'):
+                hiveClient.submit_command = MagicMock(return_value={'resultType': 'text', 'data': data})
+                exported_tables = hiveClient.log_table_ddl_batch("123", "456", "default", ["tbl1", "tbl2"],
+                                                                 'metastore/', MagicMock(), False)
+                # the tables are exported one at a time instead
+                self.assertEqual(exported_tables, {"tbl1": True, "tbl2": True})
+        self.assertEqual(hiveClient.get_table_ddl.call_count, 4)
+
+    def test_get_batch_ddl_cmd_caps_inline_ddls(self):
+        spark = MagicMock()
+        ddls = {'tbl1': 'CREATE TABLE default.tbl1 (' + 'a' * 1000 + ')',
+                'tbl2': 'CREATE TABLE default.tbl2 (' + 'b' * 1000 + ')',
+                'tbl3': 'CREATE TABLE default.tbl3 (' + 'c' * 3000 + ')',
+                'tbl4': 'CREATE TABLE default.tbl4 (id INT)'}
+        spark.sql = MagicMock(side_effect=lambda q: MagicMock(collect=MagicMock(return_value=[[ddls[q.split('.')[-1]]]])))
+        cmd = HiveClient.get_batch_ddl_cmd("default", list(ddls), max_batch_len=1500)
+        with mock.patch('sys.stdout', new=StringIO()) as fake_out:
+            exec(cmd, {'spark': spark})
+        ddl_batch = dict(json.loads(fake_out.getvalue()))
+        # tbl2 doesn't fit in the batch after tbl1 and tbl3 is larger than max_ddl_len
+        self.assertEqual(ddl_batch, {'tbl1': ddls['tbl1'], 'tbl2': None, 'tbl3': None, 'tbl4': ddls['tbl4']})
+
+    def test_log_all_tables(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.get_remote_list = MagicMock(return_value=["tbl1", "tbl2", "tbl3"])
+        hiveClient.log_table_ddl_batch = MagicMock(return_value={"tbl2": False, "tbl3": True})
+        hiveClient._persist_to_disk = MagicMock()
+        checkpoint_metastore_set = MagicMock()
+        checkpoint_metastore_set.contains = MagicMock(side_effect=lambda x: x == "default.tbl1")
+        with tempfile.TemporaryDirectory() as export_dir:
+            success_log = os.path.join(export_dir, 'success_metastore.log')
+            success_log_writer = ThreadSafeWriter(success_log, 'a')
+            hiveClient.log_all_tables("default", "123", "456", 'metastore/', MagicMock(), success_log_writer, "role1",
+                                      checkpoint_metastore_set)
+            success_log_writer.close()
+            with open(success_log, 'r') as fp:
+                exported = [json.loads(line) for line in fp]
+        self.assertEqual(exported, [{'table': 'default.tbl1', 'iam': 'role1'},
+                                    {'table': 'default.tbl3', 'iam': 'role1'}])
+        self.assertEqual(hiveClient.log_table_ddl_batch.call_args[0][3], ["tbl2", "tbl3"])
+        # the success log is persisted once for the batch before the tables are checkpointed
+        hiveClient._persist_to_disk.assert_called_once_with(success_log_writer)
+        checkpoint_metastore_set.write.assert_has_calls([mock.call("default.tbl1"), mock.call("default.tbl3")])
+
+    def test_log_all_tables_list_failure(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.submit_command = MagicMock(return_value={'resultType': 'error', 'summary': 'AnalysisException'})
+        hiveClient.log_table_ddl_batch = MagicMock()
+        error_logger = MagicMock()
+        self.assertFalse(hiveClient.log_all_tables("db2", "123", "456", 'metastore/', error_logger, MagicMock(),
+                                                   None, DisabledCheckpointKeySet()))
+        # the failure is logged to the failed metastore log with the database name
+        self.assertEqual(json.loads(error_logger.error.call_args[0][0]),
+                         {'resultType': 'error', 'summary': 'AnalysisException', 'database': 'db2'})
+        hiveClient.log_table_ddl_batch.assert_not_called()
+
+    def test_log_all_tables_shared_success_log(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        # batches of long table names are larger than the file buffer and are split into several writes
+        table_names = [f"table_with_a_rather_long_name_{i:04d}_" + 'x' * 80 for i in range(100)]
+        hiveClient.get_remote_list = MagicMock(return_value=table_names)
+        hiveClient.log_table_ddl_batch = MagicMock(return_value={x: True for x in table_names})
+        db_names = [f"db{i}" for i in range(8)]
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            success_log = os.path.join(export_dir, 'success_metastore.log')
+            success_log_writer = ThreadSafeWriter(success_log, 'a')
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(hiveClient.log_all_tables, db_name, "123", "456", 'metastore/',
+                                           MagicMock(), success_log_writer, "role1", DisabledCheckpointKeySet())
+                           for db_name in db_names]
+            success_log_writer.close()
+            self.assertTrue(all(x.result() for x in futures))
+            with open(success_log, 'r') as fp:
+                exported = [json.loads(line)['table'] for line in fp]
+        self.assertEqual(sorted(exported), sorted(f"{db}.{t}" for db in db_names for t in table_names))
+
+    def test_log_all_tables_rerun_without_checkpoint(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.get_remote_list = MagicMock(return_value=["tbl1", "tbl2"])
+        batch_output = [["tbl1", "CREATE TABLE default.tbl1 (id INT)"], ["tbl2", "CREATE TABLE default.tbl2 (id INT)"]]
+        hiveClient.submit_command = MagicMock(return_value={'resultType': 'text', 'data': json.dumps(batch_output)})
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            os.makedirs(os.path.join(export_dir, 'metastore'))
+            success_log_writer = ThreadSafeWriter(os.path.join(export_dir, 'success_metastore.log'), 'a')
+            # export the database twice, as a plain re-run does when checkpointing is disabled
+            for _ in range(2):
+                hiveClient.log_all_tables("default", "123", "456", 'metastore/', MagicMock(), success_log_writer,
+                                          None, DisabledCheckpointKeySet())
+            success_log_writer.close()
+            with open(os.path.join(export_dir, 'metastore', 'default.tables.jsonl'), 'r') as fp:
+                catalog = [json.loads(line)['table'] for line in fp]
+        self.assertEqual(catalog, ["tbl1", "tbl2"])
+
+    def test_get_exported_table_ddls(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            metastore_local_dir = export_dir + '/metastore/'
+            # db1 was exported with the per table layout of older versions, db2 with the table catalog
+            os.makedirs(metastore_local_dir + 'db1')
+            with open(metastore_local_dir + 'db1/tbl1', 'w') as fp:
+                fp.write("CREATE TABLE db1.tbl1 (id INT)")
+            hiveClient.append_table_catalog('metastore/', 'db2', [('tbl1', "CREATE TABLE db2.tbl1 (id INT)"),
+                                                                  ('tbl2', "CREATE TABLE db2.tbl2 (id INT)")])
+            # a re-run appends the table again, the last record wins
+            hiveClient.append_table_catalog('metastore/', 'db2', [('tbl1', "CREATE TABLE db2.tbl1 (id BIGINT)")])
+            self.assertEqual(hiveClient.get_exported_databases(metastore_local_dir), ['db1', 'db2'])
+            self.assertEqual(hiveClient.get_exported_table_ddls(metastore_local_dir, 'db1'),
+                             {'tbl1': "CREATE TABLE db1.tbl1 (id INT)"})
+            self.assertEqual(hiveClient.get_exported_table_ddls(metastore_local_dir, 'db2'),
+                             {'tbl1': "CREATE TABLE db2.tbl1 (id BIGINT)", 'tbl2': "CREATE TABLE db2.tbl2 (id INT)"})
+
+    def test_import_hive_metastore_batches_unicode_ddls(self):
+        checkpoint_service = MagicMock()
+        checkpoint_metastore_set = MagicMock()
+        checkpoint_metastore_set.contains = MagicMock(return_value=False)
+        checkpoint_service.get_checkpoint_key_set = MagicMock(return_value=checkpoint_metastore_set)
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.get_or_launch_cluster = MagicMock(return_value=("123", "456"))
+        hiveClient.post = MagicMock()
+        hiveClient.get_database_detail_dict = MagicMock(
+            return_value={'default': {'Location': 'dbfs:/user/hive/warehouse'}})
+        hiveClient.create_database_db = MagicMock(return_value={'resultType': 'text'})
+        hiveClient.apply_table_ddl_batch = MagicMock(side_effect=lambda ddls, ec_id, cid: [{'resultType': 'text'}
+                                                                                        for _ in ddls])
+        hiveClient.apply_large_table_ddl = MagicMock(return_value={'resultType': 'text'})
+        small_ddl = "CREATE TABLE default.tbl1 (name STRING COMMENT 'café')"
+        large_ddl = "CREATE TABLE default.tbl2 (" + ', '.join(f'c{i} INT' for i in range(200)) + ")"
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            os.makedirs(os.path.join(export_dir, 'metastore'))
+            hiveClient.append_table_catalog('metastore/', 'default', [('tbl1', small_ddl), ('tbl2', large_ddl)])
+            hiveClient.import_hive_metastore(has_unicode=True)
+        # the unicode DDL is still batched, only the large DDL is uploaded to DBFS
+        hiveClient.apply_table_ddl_batch.assert_called_once_with([small_ddl], "456", "123")
+        hiveClient.apply_large_table_ddl.assert_called_once_with(large_ddl, "456", "123")
+        checkpoint_metastore_set.write.assert_has_calls([mock.call("default.tbl2"), mock.call("default.tbl1")])
+
+    def test_get_remote_list(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        all_tables = [f"tbl{i}" for i in range(250)]
+        hiveClient.submit_command = MagicMock(side_effect=[
+            {'resultType': 'text', 'data': json.dumps([250, all_tables[:100]])},
+            {'resultType': 'text', 'data': json.dumps(all_tables[100:200])},
+            {'resultType': 'text', 'data': json.dumps(all_tables[200:])}])
+        self.assertEqual(hiveClient.get_remote_list("123", "456", 'all_tables', '[]'), all_tables)
+        self.assertEqual(hiveClient.submit_command.call_count, 3)
+
+        hiveClient.submit_command = MagicMock(return_value={'resultType': 'text', 'data': json.dumps([2, ["a", "b"]])})
+        self.assertEqual(hiveClient.get_remote_list("123", "456", 'all_tables', '[]'), ["a", "b"])
+        self.assertEqual(hiveClient.submit_command.call_count, 1)
+
+        hiveClient.submit_command = MagicMock(return_value={'resultType': 'error', 'summary': 'AnalysisException'})
+        self.assertIsNone(hiveClient.get_remote_list("123", "456", 'all_tables', '[]'))
+
+        # a failed slice is logged as json to the error logger
+        error_resp = {'resultType': 'error', 'summary': 'Context not found'}
+        hiveClient.submit_command = MagicMock(side_effect=[
+            {'resultType': 'text', 'data': json.dumps([250, all_tables[:100]])}, error_resp])
+        error_logger = MagicMock()
+        self.assertIsNone(hiveClient.get_remote_list("123", "456", 'all_tables', '[]', error_logger=error_logger))
+        self.assertEqual(json.loads(error_logger.error.call_args[0][0]), error_resp)
+
+    def test_export_hive_metastore_parallel(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.get_instance_profiles_list = MagicMock(return_value=[])
+        hiveClient.start_cluster_by_name = MagicMock(return_value="123")
+        hiveClient.get_iam_role_by_cid = MagicMock(return_value=None)
+        hiveClient.get_execution_context = MagicMock(side_effect=["ec1", "ec2", "ec3"])
+        hiveClient.get_all_databases = MagicMock(return_value=["db1", "db2", "db3", "db4"])
+        hiveClient.set_desc_database_helper = MagicMock()
+        hiveClient.get_desc_database_details = MagicMock(side_effect=lambda db_name, cid, ec_id: {'Database Name': db_name})
+        # listing the tables of db3 fails
+        hiveClient.log_all_tables = MagicMock(side_effect=lambda db_name, *args: db_name != "db3")
+        with tempfile.TemporaryDirectory() as export_dir:
+            hiveClient.get_export_dir = MagicMock(return_value=export_dir + '/')
+            with self.assertLogs(level='ERROR') as logs:
+                hiveClient.export_hive_metastore(cluster_name="test", num_parallel=2)
+            self.assertIn("ERROR:root:Failed to list tables of 1 database(s): db3", logs.output)
+            with open(os.path.join(export_dir, 'database_details.log'), 'r') as fp:
+                exported_dbs = sorted(json.loads(line)['Database Name'] for line in fp)
+        self.assertEqual(exported_dbs, ["db1", "db2", "db3", "db4"])
+        # one execution context for listing databases plus one more for the second worker
+        self.assertEqual(hiveClient.get_execution_context.call_count, 2)
+        used_ec_ids = {call[0][2] for call in hiveClient.log_all_tables.call_args_list}
+        self.assertTrue(used_ec_ids <= {"ec1", "ec2"})
+        self.assertEqual(hiveClient.log_all_tables.call_count, 4)
+
+    def test_retry_failed_metastore_export(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        hiveClient.edit_cluster = MagicMock()
+        hiveClient.get_execution_context = MagicMock(return_value="456")
+        # the first role exports every other table, the second role exports the rest
+        hiveClient.log_table_ddl_batch = MagicMock(side_effect=[
+            {"tbl0": True, "tbl1": False, "tbl2": True, "tbl3": False},
+            {"tbl1": True, "tbl3": True}])
+        checkpoint_metastore_set = MagicMock()
+        with tempfile.TemporaryDirectory() as export_dir:
+            failed_log = os.path.join(export_dir, 'failed_metastore.log')
+            success_log = os.path.join(export_dir, 'success_metastore.log')
+            failed_db_entry = json.dumps({'resultType': 'error', 'summary': 'AnalysisException', 'database': 'db2'})
+            with open(failed_log, 'w') as fp:
+                for i in range(4):
+                    fp.write(json.dumps({'resultType': 'error', 'table': f'default.tbl{i}'}) + '\n')
+                fp.write(failed_db_entry + '\n')
+            hiveClient.retry_failed_metastore_export("123", failed_log, MagicMock(), ["role1", "role2", "role3"],
+                                                     success_log, False, checkpoint_metastore_set)
+            # the failed database entry is kept in the log, it isn't retried
+            with open(failed_log, 'r') as fp:
+                self.assertEqual(fp.read(), failed_db_entry + '\n')
+            with open(success_log, 'r') as fp:
+                exported = [json.loads(line) for line in fp]
+        self.assertEqual(exported, [{'table': 'default.tbl0', 'iam': 'role1'},
+                                    {'table': 'default.tbl2', 'iam': 'role1'},
+                                    {'table': 'default.tbl1', 'iam': 'role2'},
+                                    {'table': 'default.tbl3', 'iam': 'role2'}])
+        self.assertEqual(hiveClient.log_table_ddl_batch.call_args_list[1][0][3], ["tbl1", "tbl3"])
+        # no failed tables remain after the second role, so the cluster isn't edited for the third one
+        self.assertEqual(hiveClient.edit_cluster.call_count, 2)
+
+    def test_apply_table_ddl_batch(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        applied_ddls = []
+
+        class FakeSpark:
+            def sql(self, ddl):
+                if 'tbl2' in ddl:
+                    raise ValueError("Table default.tbl2 already exists")
+                applied_ddls.append(ddl)
+
+        def run_batch_cmd(cid, ec_id, cmd):
+            with mock.patch('sys.stdout', new=StringIO()) as fake_out:
+                exec(cmd, {'spark': FakeSpark()})
+            return {'resultType': 'text', 'data': fake_out.getvalue()}
+
+        hiveClient.submit_command = MagicMock(side_effect=run_batch_cmd)
+        table_ddls = ['CREATE TABLE default.tbl1 (comment STRING COMMENT """quoted""")',
+                      'CREATE TABLE default.tbl2 (id INT)',
+                      "CREATE TABLE default.tbl3 (name STRING COMMENT 'café')"]
+        results = hiveClient.apply_table_ddl_batch(table_ddls, "456", "123")
+        self.assertEqual(hiveClient.submit_command.call_count, 1)
+        self.assertEqual(applied_ddls, [table_ddls[0], table_ddls[2]])
+        self.assertEqual([x['resultType'] for x in results], ['text', 'error', 'text'])
+        self.assertEqual(results[1]['summary'], "ValueError: Table default.tbl2 already exists")
+
+    def test_apply_table_ddl_batch_unparsable_output(self):
+        checkpoint_service = MagicMock()
+        hiveClient = HiveClient(TEST_CONFIG, checkpoint_service)
+        table_ddls = ['CREATE TABLE default.tbl1 (id INT)', 'CREATE TABLE default.tbl2 (id INT)']
+        hiveClient.submit_command = MagicMock(side_effect=[{'resultType': 'text', 'data': '[[0, "Analysis'},
+                                                           {'resultType': 'text'},
+                                                           {'resultType': 'error', 'summary': 'AnalysisException'}])
+        results = hiveClient.apply_table_ddl_batch(table_ddls, "456", "123")
+        # the DDLs are applied one at a time instead
+        self.assertEqual([x['resultType'] for x in results], ['text', 'error'])
+        self.assertEqual(hiveClient.submit_command.call_args_list[1][0][2], HiveClient.get_spark_ddl(table_ddls[0]))
+
+    def test_get_num_of_lines(self):
+        with tempfile.TemporaryDirectory() as export_dir:
+            log_file = os.path.join(export_dir, 'failed_metastore.log')
+            self.assertEqual(HiveClient.get_num_of_lines(log_file), 0)
+            open(log_file, 'w').close()
+            self.assertEqual(HiveClient.get_num_of_lines(log_file), 0)
+            with open(log_file, 'w') as fp:
+                fp.write('{"table": "default.tbl1"}\n{"table": "default.tbl2"}\n')
+            self.assertEqual(HiveClient.get_num_of_lines(log_file), 2)
+            with open(log_file, 'a') as fp:
+                fp.write('{"table": "default.tbl3"}')
+            self.assertEqual(HiveClient.get_num_of_lines(log_file), 3)
+
+    def test_get_spark_ddl(self):
+        applied_ddls = []
+        spark = MagicMock()
+        spark.sql = MagicMock(side_effect=applied_ddls.append)
+        table_ddl = 'CREATE TABLE default.tbl1 (id INT COMMENT """quoted id""", name STRING COMMENT \'café\')'
+        exec(HiveClient.get_spark_ddl(table_ddl), {'spark': spark})
+        self.assertEqual(applied_ddls, [table_ddl])
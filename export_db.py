@@ -156,7 +156,8 @@ def main():
             hive_c.export_database(database_name, args.cluster_name, args.iam, has_unicode=args.metastore_unicode)
         else:
             # export all of the metastore
-            hive_c.export_hive_metastore(cluster_name=args.cluster_name, has_unicode=args.metastore_unicode)
+            hive_c.export_hive_metastore(cluster_name=args.cluster_name, has_unicode=args.metastore_unicode,
+                                         num_parallel=args.num_parallel)
         end = timer()
         print("Complete Metastore Export Time: " + str(timedelta(seconds=end - start)))
 
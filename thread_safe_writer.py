@@ -21,5 +21,12 @@ class ThreadSafeWriter():
             self.filewriter.write(data)
             self.filewriter.flush()
 
+    def flush(self):
+        with self.global_lock:
+            self.filewriter.flush()
+
+    def fileno(self):
+        return self.filewriter.fileno()
+
     def close(self):
         self.filewriter.close()